@@ -0,0 +1,871 @@
+import os
+import io
+import numpy as np
+from PIL import Image
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+import tensorflow as tf
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from werkzeug.serving import make_server
+import cv2        
+import numba
+import traceback   
+import mimetypes   
+import tempfile    
+import shutil
+import argparse  
+import queue
+import threading
+import hashlib
+import collections
+import concurrent.futures
+import time
+
+## optional TensorRT runtime, Keras inference is used when it is missing
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+    import tf2onnx
+except ImportError:
+    trt = None
+
+## optional PyAV decoder, lets CPU decoding read the upload stream directly instead of a temp file
+try:
+    import av
+except ImportError:
+    av = None
+
+## threshold value to classify, used by every node that has no threshold of its own
+PREDICTION_THRESHOLD = float(os.environ.get("PREDICTION_THRESHOLD", "0.7"))
+## per-node thresholds keyed by port, e.g. NODE_THRESHOLDS="5001=0.7,5002=0.8,5003=0.9"
+NODE_THRESHOLDS = {}
+for node_spec in filter(None, os.environ.get("NODE_THRESHOLDS", "").split(",")):
+    node_port, node_threshold = node_spec.split("=")
+    NODE_THRESHOLDS[int(node_port)] = float(node_threshold)
+## image parameters
+IMAGE_MODEL_FILENAME = "deepfake_model.keras"
+IMAGE_MODEL_PATH = os.path.join(os.path.dirname(__file__), IMAGE_MODEL_FILENAME)
+IMAGE_HEIGHT = 224
+IMAGE_WIDTH = 224
+IMAGE_EXPECTED_CHANNELS = 3
+## video parameters
+VIDEO_MODEL_FILENAME = "deepfake-detection-model1.h5" # Match your file
+VIDEO_MODEL_PATH = os.path.join(os.path.dirname(__file__), VIDEO_MODEL_FILENAME)
+VIDEO_FRAME_HEIGHT = 224
+VIDEO_FRAME_WIDTH = 224
+VIDEO_EXPECTED_CHANNELS = 3
+VIDEO_FRAME_SAMPLE_RATE = 15
+VIDEO_BATCH_SIZE = 32
+## float32 reciprocal used to scale pixels to 0-1 without float64 intermediates
+INV_255 = np.float32(1.0 / 255.0)
+USE_NVDEC = True
+VIDEO_PIPELINE_QUEUE_SIZE = 8
+## request threads and the video pipeline stages already run in parallel, so OpenCV itself stays single-threaded
+OPENCV_NUM_THREADS = 1
+## preallocated preprocessing buffers shared by all requests of the process
+IMAGE_BUFFER_POOL_SIZE = 8
+VIDEO_BATCH_POOL_SIZE = 4
+## tensorrt parameters
+USE_TENSORRT = True
+TRT_MAX_BATCH_SIZE = 32
+TRT_WORKSPACE_BYTES = 1 << 30
+ONNX_OPSET = 15
+## XLA compiles once per distinct batch size, so it is off while batch sizes vary per request
+TF_JIT_COMPILE = False
+TRT_USE_INT8 = True
+TRT_CALIBRATION_BATCH_SIZE = 8
+IMAGE_CALIBRATION_PATH = os.path.join(os.path.dirname(__file__), "calibration_images.npy")
+VIDEO_CALIBRATION_PATH = os.path.join(os.path.dirname(__file__), "calibration_frames.npy")
+
+cv2.setNumThreads(OPENCV_NUM_THREADS)
+
+## NVDEC decoding needs an OpenCV build with CUDA and the cudacodec module
+try:
+    NVDEC_AVAILABLE = USE_NVDEC and hasattr(cv2, 'cudacodec') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+except cv2.error:
+    NVDEC_AVAILABLE = False
+
+## micro-batching of concurrent inference requests
+BATCHER_MAX_BATCH_SIZE = 16
+## video requests arrive as whole frame batches, so merge up to this many of them per model call
+VIDEO_BATCHER_MAX_BATCHES = 4
+BATCHER_MAX_WAIT_SECONDS = 0.005
+INFERENCE_TIMEOUT_SECONDS = 30
+## number of recent (model, score) results kept, keyed by a hash of the uploaded file
+RESULT_CACHE_SIZE = 1024
+## uploads are hashed in chunks of this size instead of being read into memory at once
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+## initialize flask app
+app = Flask(__name__)
+CORS(app)
+
+## defining image as well as video model
+image_model = None
+video_model = None
+model_load_error = []
+
+## allocate GPU memory on demand instead of reserving all of it for this process
+for gpu in tf.config.list_physical_devices('GPU'):
+    try:
+        tf.config.experimental.set_memory_growth(gpu, True)
+    except RuntimeError as e:
+        print(f"Warning: Could not enable memory growth for {gpu.name}: {e}")
+
+print("--- Loading Image Model ---")
+if os.path.exists(IMAGE_MODEL_PATH):
+    try:
+        print(f"Attempting to load Image model from: {IMAGE_MODEL_PATH}")
+        image_model = tf.keras.models.load_model(IMAGE_MODEL_PATH)
+        print(f"Image Model ({IMAGE_MODEL_FILENAME}) loaded successfully.")
+    except Exception as e:
+        err_msg = f"Error loading Keras Image model ({IMAGE_MODEL_FILENAME}): {e}"
+        model_load_error.append(err_msg)
+        print(f"ERROR: {err_msg}")
+else:
+    err_msg = f"Image Model file not found at {IMAGE_MODEL_PATH}"
+    model_load_error.append(err_msg)
+    print(f"ERROR: {err_msg}")
+
+# Load Video Model
+print("--- Loading Video Model ---")
+if os.path.exists(VIDEO_MODEL_PATH):
+    try:
+        print(f"Attempting to load Video model from: {VIDEO_MODEL_PATH}")
+        # Use compile=False if inference only, adjust if needed
+        video_model = tf.keras.models.load_model(VIDEO_MODEL_PATH, compile=False)
+        print(f"Video Model ({VIDEO_MODEL_FILENAME}) loaded successfully.")
+    except Exception as e:
+        err_msg = f"Error loading Keras Video model ({VIDEO_MODEL_FILENAME}): {e}"
+        model_load_error.append(err_msg)
+        print(f"ERROR: {err_msg}")
+else:
+    err_msg = f"Video Model file not found at {VIDEO_MODEL_PATH}"
+    model_load_error.append(err_msg)
+    print(f"ERROR: {err_msg}")
+
+print("--- Model Loading Complete ---")
+if model_load_error:
+    print("Model Loading Errors Encountered:")
+    for error in model_load_error:
+        print(f"- {error}")
+if image_model is None and video_model is None:
+    print("CRITICAL ERROR: No models could be loaded. The application might not function.")
+print("----------------------------")
+
+## trace each model once with a fixed signature so single-sample calls never retrace
+image_infer = None
+video_infer = None
+if image_model is not None:
+    image_infer = tf.function(lambda x: image_model(x, training=False), jit_compile=TF_JIT_COMPILE,
+                              input_signature=[tf.TensorSpec([None, IMAGE_HEIGHT, IMAGE_WIDTH, IMAGE_EXPECTED_CHANNELS], tf.float32)])
+if video_model is not None:
+    video_infer = tf.function(lambda x: video_model(x, training=False), jit_compile=TF_JIT_COMPILE,
+                              input_signature=[tf.TensorSpec([None, VIDEO_FRAME_HEIGHT, VIDEO_FRAME_WIDTH, VIDEO_EXPECTED_CHANNELS], tf.float32)])
+
+def model_file_digest(path):
+    """Returns a short BLAKE2b hex digest of a model file, used to key the caches derived from it."""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+if trt is not None:
+    class NpyEntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        """Feeds preprocessed samples from a .npy file (N, H, W, C float32) to the INT8 calibrator."""
+
+        def __init__(self, data_path, cache_path, batch_size=TRT_CALIBRATION_BATCH_SIZE):
+            trt.IInt8EntropyCalibrator2.__init__(self)
+            self.cache_path = cache_path
+            self.batch_size = batch_size
+            self.index = 0
+            self.data = np.load(data_path, mmap_mode='r') if os.path.exists(data_path) else None
+            self.d_batch = None
+            if self.data is not None:
+                self.d_batch = cuda.mem_alloc(batch_size * int(np.prod(self.data.shape[1:])) * 4)
+
+        def get_batch_size(self):
+            return self.batch_size
+
+        def get_batch(self, names):
+            if self.data is None or self.index + self.batch_size > len(self.data):
+                return None
+            batch = np.ascontiguousarray(self.data[self.index:self.index + self.batch_size], dtype=np.float32)
+            cuda.memcpy_htod(self.d_batch, batch)
+            self.index += self.batch_size
+            return [int(self.d_batch)]
+
+        def read_calibration_cache(self):
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, 'rb') as f:
+                    return f.read()
+            return None
+
+        def write_calibration_cache(self, cache):
+            with open(self.cache_path, 'wb') as f:
+                f.write(cache)
+
+class TRTRunner:
+    """Runs a Keras model through a TensorRT engine (INT8, FP16 or FP32) built from an ONNX export."""
+
+    def __init__(self, keras_model, model_path, input_shape, calibration_path=None, max_batch_size=TRT_MAX_BATCH_SIZE):
+        cuda.init()
+        self.cuda_ctx = cuda.Device(0).retain_primary_context()
+        self.model_path = model_path
+        self.input_shape = tuple(input_shape)
+        self.max_batch_size = max_batch_size
+        self.logger = trt.Logger(trt.Logger.WARNING)
+        ## the execution context and I/O buffers are shared, so one request runs the engine at a time
+        self.lock = threading.Lock()
+        ## engine and calibration caches are keyed by the model weights, so replaced model files are rebuilt
+        self.cache_prefix = f"{os.path.splitext(model_path)[0]}.{model_file_digest(model_path)}"
+        ## INT8 needs either calibration samples or a calibration cache from an earlier build
+        self.calibration_path = calibration_path
+        self.calibration_cache_path = self.cache_prefix + ".int8.calib"
+        self.precision = "fp16"
+        if TRT_USE_INT8 and calibration_path and (os.path.exists(calibration_path) or os.path.exists(self.calibration_cache_path)):
+            self.precision = "int8"
+        self.cuda_ctx.push()
+        try:
+            builder = trt.Builder(self.logger)
+            if self.precision == "int8" and not builder.platform_has_fast_int8:
+                print(f"Warning: GPU has no fast INT8 support, building {os.path.basename(model_path)} as FP16.")
+                self.precision = "fp16"
+            if self.precision == "fp16" and not builder.platform_has_fast_fp16:
+                print(f"Warning: GPU has no fast FP16 support, building {os.path.basename(model_path)} as FP32.")
+                self.precision = "fp32"
+            major, minor = cuda.Device(0).compute_capability()
+            self.engine_path = f"{self.cache_prefix}.trt{trt.__version__}.sm{major}{minor}.{self.precision}.engine"
+            runtime = trt.Runtime(self.logger)
+            self.engine = None
+            if os.path.exists(self.engine_path):
+                print(f"Loading cached TensorRT engine: {self.engine_path}")
+                with open(self.engine_path, 'rb') as f:
+                    self.engine = runtime.deserialize_cuda_engine(f.read())
+                if self.engine is None:
+                    print(f"Warning: Cached TensorRT engine is unusable, rebuilding: {self.engine_path}")
+            if self.engine is None:
+                self.engine = runtime.deserialize_cuda_engine(self.build_engine(keras_model, builder))
+            if self.engine is None:
+                raise RuntimeError(f"Could not deserialize TensorRT engine for {model_path}")
+            self.context = self.engine.create_execution_context()
+            io_names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+            self.input_name = next(n for n in io_names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT)
+            self.output_name = next(n for n in io_names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT)
+            output_shape = tuple(self.engine.get_tensor_shape(self.output_name))[1:]
+            self.d_input = cuda.mem_alloc(max_batch_size * int(np.prod(self.input_shape)) * 4)
+            self.d_output = cuda.mem_alloc(max_batch_size * int(np.prod(output_shape)) * 4)
+            self.h_output = cuda.pagelocked_empty((max_batch_size,) + output_shape, np.float32)
+            self.bindings = [int(self.d_input) if n == self.input_name else int(self.d_output) for n in io_names]
+        finally:
+            cuda.Context.pop()
+
+    def build_engine(self, keras_model, builder):
+        """Exports the Keras model to ONNX and builds a serialized engine with a dynamic batch dimension.
+        INT8 calibration results are cached next to the model file, so rebuilds skip calibration."""
+        onnx_path = os.path.splitext(self.model_path)[0] + ".onnx"
+        input_spec = (tf.TensorSpec((None,) + self.input_shape, tf.float32, name="input"),)
+        forward = tf.function(lambda x: keras_model(x, training=False), input_signature=input_spec)
+        print(f"Exporting {os.path.basename(self.model_path)} to ONNX: {onnx_path}")
+        tf2onnx.convert.from_function(forward, input_signature=input_spec, opset=ONNX_OPSET, output_path=onnx_path)
+        network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+        parser = trt.OnnxParser(network, self.logger)
+        with open(onnx_path, 'rb') as f:
+            if not parser.parse(f.read()):
+                errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+                raise RuntimeError(f"ONNX parse failed for {onnx_path}: {errors}")
+        config = builder.create_builder_config()
+        config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, TRT_WORKSPACE_BYTES)
+        if builder.platform_has_fast_fp16:
+            config.set_flag(trt.BuilderFlag.FP16)
+        profile = builder.create_optimization_profile()
+        profile.set_shape(network.get_input(0).name, (1,) + self.input_shape, (1,) + self.input_shape,
+                          (self.max_batch_size,) + self.input_shape)
+        config.add_optimization_profile(profile)
+        calibrator = None
+        if self.precision == "int8":
+            ## TensorRT calibrates at the calibration profile's kOPT shape, so it must match the calibrator batch
+            calibration_shape = (TRT_CALIBRATION_BATCH_SIZE,) + self.input_shape
+            calibration_profile = builder.create_optimization_profile()
+            calibration_profile.set_shape(network.get_input(0).name, calibration_shape, calibration_shape, calibration_shape)
+            calibrator = NpyEntropyCalibrator(self.calibration_path, self.calibration_cache_path, TRT_CALIBRATION_BATCH_SIZE)
+            config.set_flag(trt.BuilderFlag.INT8)
+            config.int8_calibrator = calibrator
+            config.set_calibration_profile(calibration_profile)
+        print(f"Building TensorRT engine (this can take a few minutes): {self.engine_path}")
+        serialized = builder.build_serialized_network(network, config)
+        if serialized is None:
+            raise RuntimeError(f"TensorRT engine build failed for {onnx_path}")
+        with open(self.engine_path, 'wb') as f:
+            f.write(serialized)
+        return serialized
+
+    def infer(self, batch):
+        """Runs a float32 NHWC batch through the engine, in chunks of max_batch_size."""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        outputs = []
+        with self.lock:
+            self.cuda_ctx.push()
+            try:
+                for start in range(0, batch.shape[0], self.max_batch_size):
+                    chunk = batch[start:start + self.max_batch_size]
+                    self.context.set_input_shape(self.input_name, chunk.shape)
+                    cuda.memcpy_htod(self.d_input, chunk)
+                    self.context.execute_v2(self.bindings)
+                    cuda.memcpy_dtoh(self.h_output, self.d_output)
+                    outputs.append(self.h_output[:chunk.shape[0]].copy())
+            finally:
+                cuda.Context.pop()
+        return np.concatenate(outputs)
+
+def build_trt_runner(keras_model, model_path, input_shape, calibration_path, label):
+    """Builds a TRTRunner for a loaded model, returns None so callers fall back to Keras on failure."""
+    if keras_model is None:
+        return None
+    try:
+        runner = TRTRunner(keras_model, model_path, input_shape, calibration_path)
+        print(f"{label} TensorRT engine ready ({runner.precision}): {runner.engine_path}")
+        return runner
+    except Exception as e:
+        print(f"Warning: TensorRT engine unavailable for {label} model, using Keras: {e}")
+        return None
+
+trt_image = None
+trt_video = None
+if USE_TENSORRT and trt is not None:
+    print("--- Building TensorRT Engines ---")
+    trt_image = build_trt_runner(image_model, IMAGE_MODEL_PATH, (IMAGE_HEIGHT, IMAGE_WIDTH, IMAGE_EXPECTED_CHANNELS),
+                                 IMAGE_CALIBRATION_PATH, "Image")
+    trt_video = build_trt_runner(video_model, VIDEO_MODEL_PATH, (VIDEO_FRAME_HEIGHT, VIDEO_FRAME_WIDTH, VIDEO_EXPECTED_CHANNELS),
+                                 VIDEO_CALIBRATION_PATH, "Video")
+    print("----------------------------")
+
+def run_image_model(batch):
+    """Returns image model predictions for a preprocessed batch, using TensorRT when available."""
+    if trt_image is not None:
+        return trt_image.infer(batch)
+    return image_infer(batch).numpy()
+
+def run_video_model(batch):
+    """Returns video model predictions for a preprocessed batch, using TensorRT when available."""
+    if trt_video is not None:
+        return trt_video.infer(batch)
+    return video_infer(batch).numpy()
+
+class Batcher(threading.Thread):
+    """Groups inference requests from concurrent threads into a single model call.
+    After the first request arrives, more are collected for up to max_wait seconds or until
+    max_batch_size samples are pending, then each caller's Future receives its own rows."""
+
+    def __init__(self, run_model, max_batch_size=BATCHER_MAX_BATCH_SIZE, max_wait=BATCHER_MAX_WAIT_SECONDS):
+        super().__init__(daemon=True)
+        self.run_model = run_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+
+    def submit(self, batch):
+        """Queues an (n, H, W, C) batch and returns a Future resolving to its n predictions.
+        The batch must stay unchanged until the Future is done."""
+        future = concurrent.futures.Future()
+        self.requests.put((batch, future))
+        return future
+
+    def wait_for(self, future, timeout=INFERENCE_TIMEOUT_SECONDS):
+        """Returns the predictions of a submitted batch. On timeout the request is cancelled so the model
+        never runs it; a batch that is already running is waited for, so its input buffer can be reused."""
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def run(self):
+        while True:
+            pending = [self.requests.get()]
+            sample_count = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while sample_count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                sample_count += len(item[0])
+            ## drop requests whose caller timed out and cancelled them
+            pending = [(batch, future) for batch, future in pending if future.set_running_or_notify_cancel()]
+            if not pending: continue
+            try:
+                if len(pending) == 1:
+                    preds = self.run_model(pending[0][0])
+                else:
+                    preds = self.run_model(np.concatenate([batch for batch, _ in pending]))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for batch, future in pending:
+                future.set_result(preds[offset:offset + len(batch)])
+                offset += len(batch)
+
+image_batcher = None
+video_batcher = None
+if image_model is not None:
+    image_batcher = Batcher(run_image_model)
+    image_batcher.start()
+if video_model is not None:
+    video_batcher = Batcher(run_video_model, max_batch_size=VIDEO_BATCHER_MAX_BATCHES * VIDEO_BATCH_SIZE)
+    video_batcher.start()
+
+class BufferPool:
+    """Bounded, process-wide pool of preallocated float32 buffers.
+    A request checks a buffer out with acquire() and must hand it back with release(); acquire() waits
+    while every buffer is in use."""
+
+    def __init__(self, shape, count):
+        self.free = queue.Queue()
+        for _ in range(count):
+            self.free.put(np.empty(shape, dtype=np.float32))
+
+    def acquire(self):
+        return self.free.get()
+
+    def release(self, buffer):
+        self.free.put(buffer)
+
+image_buffer_pool = BufferPool((1, IMAGE_HEIGHT, IMAGE_WIDTH, IMAGE_EXPECTED_CHANNELS), IMAGE_BUFFER_POOL_SIZE)
+video_batch_pool = BufferPool((VIDEO_BATCH_SIZE, VIDEO_FRAME_HEIGHT, VIDEO_FRAME_WIDTH, VIDEO_EXPECTED_CHANNELS), VIDEO_BATCH_POOL_SIZE)
+
+def preprocess_image(image_bytes, image_buffer):
+    """Preprocesses image bytes for the image model into a (1, H, W, C) float32 buffer and returns it."""
+    try:
+        ## decoded as 3-channel BGR, EXIF orientation ignored as it was with PIL
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            ## OpenCV cannot decode some formats the client accepts (e.g. GIF), PIL can
+            try:
+                pil_img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            except Exception as pil_e:
+                raise ValueError(f"Could not decode image data: {pil_e}")
+            img = cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+        img = cv2.resize(img, (IMAGE_WIDTH, IMAGE_HEIGHT), interpolation=cv2.INTER_AREA)
+        fused_bgr_to_rgb_norm(img, image_buffer[0])
+        return image_buffer
+    except Exception as e:
+        print(f"Error preprocessing image: {e}")
+        raise ValueError(f"Error preprocessing image: {e}")
+
+## not parallel=True: numba's default workqueue layer aborts when called from several request threads
+@numba.njit(fastmath=True, cache=True)
+def fused_bgr_to_rgb_norm(src_u8, dst_f32):
+    """Writes a uint8 BGR image into a float32 RGB buffer scaled to 0-1 in a single pass."""
+    for i in range(src_u8.shape[0]):
+        for j in range(src_u8.shape[1]):
+            dst_f32[i, j, 0] = np.float32(src_u8[i, j, 2]) * INV_255
+            dst_f32[i, j, 1] = np.float32(src_u8[i, j, 1]) * INV_255
+            dst_f32[i, j, 2] = np.float32(src_u8[i, j, 0]) * INV_255
+
+def preprocess_video_frame(frame_np, out):
+    """Preprocesses a single video frame (BGR NumPy array from cv2) for the VIDEO model.
+    Writes the normalized RGB frame into `out` (one float32 slot of the frame batch)."""
+    try:
+        if frame_np.shape[:2] == (VIDEO_FRAME_HEIGHT, VIDEO_FRAME_WIDTH):
+            img_resized = frame_np
+        else:
+            img_resized = cv2.resize(frame_np, (VIDEO_FRAME_WIDTH, VIDEO_FRAME_HEIGHT))
+        if img_resized.ndim != 3 or img_resized.shape[-1] != VIDEO_EXPECTED_CHANNELS:
+           print(f"Warning: Frame has shape {img_resized.shape}, expected {VIDEO_EXPECTED_CHANNELS} channels.")
+           return None
+        fused_bgr_to_rgb_norm(img_resized, out)
+        return out
+    except Exception as e:
+        print(f"Error preprocessing frame: {e}")
+        return None
+
+def score_image(image_bytes):
+    """Preprocesses an image into a pooled input buffer and returns the image model's score."""
+    image_buffer = image_buffer_pool.acquire()
+    try:
+        processed_input = preprocess_image(image_bytes, image_buffer)
+        prediction = image_batcher.wait_for(image_batcher.submit(processed_input))
+        return prediction[0][0]
+    finally:
+        image_buffer_pool.release(image_buffer)
+
+def predict_frame_batch(frames_batch):
+    """Runs the video model once over a batch of preprocessed frames.
+    Returns an array with one score per frame, or None if the batch could not be scored."""
+    try:
+        preds = video_batcher.wait_for(video_batcher.submit(frames_batch))
+        return preds[:, 0]
+    except Exception as pred_e:
+        print(f"Warning: Error predicting batch of {len(frames_batch)} frames: {pred_e}")
+        return None
+
+def sample_frames_cpu(cap):
+    """Yields (frame_index, BGR frame) for every VIDEO_FRAME_SAMPLE_RATE-th frame of an opened cv2.VideoCapture."""
+    frame_index = 0
+    try:
+        while True:
+            ## grab() still decodes the frames between samples, but skips their conversion to BGR images
+            skipped = 0
+            while skipped < VIDEO_FRAME_SAMPLE_RATE - 1 and cap.grab():
+                skipped += 1
+            if skipped < VIDEO_FRAME_SAMPLE_RATE - 1: break
+            ret, frame = cap.read()
+            if not ret: break
+            frame_index += VIDEO_FRAME_SAMPLE_RATE
+            yield frame_index, frame
+    finally:
+        cap.release()
+
+def sample_frames_nvdec(reader):
+    """Same sampling as sample_frames_cpu, but frames are decoded by NVDEC and resized on the GPU,
+    so only the small model-sized frame is copied back to host memory."""
+    frame_index = 0
+    while True:
+        skipped = 0
+        while skipped < VIDEO_FRAME_SAMPLE_RATE - 1 and reader.grab():
+            skipped += 1
+        if skipped < VIDEO_FRAME_SAMPLE_RATE - 1: break
+        ret, gpu_frame = reader.nextFrame()
+        if not ret: break
+        frame_index += VIDEO_FRAME_SAMPLE_RATE
+        if gpu_frame.channels() == 4:
+            gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR)
+        gpu_resized = cv2.cuda.resize(gpu_frame, (VIDEO_FRAME_WIDTH, VIDEO_FRAME_HEIGHT))
+        yield frame_index, gpu_resized.download()
+
+def open_frame_sampler(video_path):
+    """Returns a sampled-frame iterator for the video, decoding on the GPU when NVDEC is available."""
+    if NVDEC_AVAILABLE:
+        try:
+            reader = cv2.cudacodec.createVideoReader(video_path)
+            print("Decoding video on GPU (NVDEC).")
+            return sample_frames_nvdec(reader)
+        except cv2.error as e:
+            print(f"Warning: NVDEC could not open video, decoding on CPU: {e}")
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open temporary video file: {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Video has {total_frames} frames.")
+    if total_frames == 0:
+        cap.release()
+        raise ValueError("Video file contains no frames.")
+    return sample_frames_cpu(cap)
+
+def sample_frames_pyav(container):
+    """Yields (frame_index, BGR frame) for every VIDEO_FRAME_SAMPLE_RATE-th frame of an opened PyAV container.
+    Every frame still goes through the decoder, only sampled frames are converted to arrays."""
+    try:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        frame_index = 0
+        for frame in container.decode(stream):
+            frame_index += 1
+            if frame_index % VIDEO_FRAME_SAMPLE_RATE == 0:
+                yield frame_index, frame.to_ndarray(format='bgr24')
+    finally:
+        container.close()
+
+def open_pyav_frame_sampler(video_file):
+    """Returns a sampled-frame iterator that decodes the uploaded file object directly with PyAV."""
+    try:
+        container = av.open(video_file)
+    except av.error.FFmpegError as e:
+        raise ValueError(f"Could not open video data: {e}")
+    if not container.streams.video:
+        container.close()
+        raise ValueError("Video file contains no video stream.")
+    print("Decoding video in memory (PyAV).")
+    return sample_frames_pyav(container)
+
+def put_until_stopped(q, item, stop_event):
+    """Puts an item on a bounded pipeline queue, giving up once the pipeline has been stopped."""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def read_frames_worker(frame_sampler, frame_queue, stop_event):
+    """Pipeline stage 1: decodes sampled frames and hands them to the preprocessing stage.
+    A decode error is forwarded as the exception object, the stage always ends with None."""
+    try:
+        for item in frame_sampler:
+            if not put_until_stopped(frame_queue, item, stop_event):
+                return
+    except Exception as e:
+        put_until_stopped(frame_queue, e, stop_event)
+    finally:
+        frame_sampler.close()
+        put_until_stopped(frame_queue, None, stop_event)
+
+def infer_batches_worker(batch_queue, score_batches, failed_batches):
+    """Pipeline stage 3: runs the video model on (buffer, frame count) batches until it receives None,
+    handing each buffer back to video_batch_pool once its predictions are read.
+    The frame count of every batch that could not be scored is appended to failed_batches."""
+    while True:
+        item = batch_queue.get()
+        if item is None: break
+        frames_batch, batch_count = item
+        try:
+            frame_scores = predict_frame_batch(frames_batch[:batch_count])
+            if frame_scores is None:
+                failed_batches.append(batch_count)
+            else:
+                score_batches.append(frame_scores)
+        finally:
+            video_batch_pool.release(frames_batch)
+
+def analyze_video(video_file):
+    """Analyzes a video (a seekable file object) by processing sampled frames.
+    Returns (average prediction score, number of frame batches that failed to score)."""
+    if video_model is None:
+        raise ValueError("Video model is not loaded.")
+    temp_file = None
+    video_path = None
+    try:
+        if NVDEC_AVAILABLE or av is None:
+            ## NVDEC and cv2.VideoCapture can only open files
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+            video_path = temp_file.name
+            shutil.copyfileobj(video_file, temp_file)
+            temp_file.close()
+            print(f"Video saved temporarily to: {video_path}")
+            frame_sampler = open_frame_sampler(video_path)
+        else:
+            frame_sampler = open_pyav_frame_sampler(video_file)
+        ## decode -> preprocess -> infer run concurrently, connected by bounded queues
+        frame_queue = queue.Queue(maxsize=VIDEO_PIPELINE_QUEUE_SIZE)
+        batch_queue = queue.Queue(maxsize=VIDEO_PIPELINE_QUEUE_SIZE)
+        stop_event = threading.Event()
+        score_batches = []
+        failed_batches = []
+        reader_thread = threading.Thread(target=read_frames_worker, args=(frame_sampler, frame_queue, stop_event), daemon=True)
+        infer_thread = threading.Thread(target=infer_batches_worker, args=(batch_queue, score_batches, failed_batches), daemon=True)
+        reader_thread.start()
+        infer_thread.start()
+        ## the batch being filled, owned by this thread until it is queued for inference
+        frames_batch = None
+        try:
+            frames_batch = video_batch_pool.acquire()
+            batch_count = 0
+            while True:
+                item = frame_queue.get()
+                if item is None: break
+                if isinstance(item, Exception): raise item
+                current_frame_index, frame = item
+                processed_frame = preprocess_video_frame(frame, frames_batch[batch_count])
+                if processed_frame is not None:
+                    batch_count += 1
+                    if batch_count == VIDEO_BATCH_SIZE:
+                        batch_queue.put((frames_batch, batch_count))
+                        frames_batch = video_batch_pool.acquire()
+                        batch_count = 0
+                else:
+                     print(f"Warning: Skipping frame {current_frame_index} due to preprocessing error.")
+            if batch_count:
+                batch_queue.put((frames_batch, batch_count))
+                frames_batch = None
+        finally:
+            if frames_batch is not None:
+                video_batch_pool.release(frames_batch)
+            stop_event.set()
+            batch_queue.put(None)
+            reader_thread.join()
+            infer_thread.join()
+        frame_scores = np.concatenate(score_batches) if score_batches else np.empty(0, dtype=np.float32)
+        print(f"Finished processing video. Analyzed {frame_scores.size} frames, {sum(failed_batches)} frames failed.")
+        if frame_scores.size == 0:
+            raise ValueError("No frames were successfully processed for prediction.")
+        average_score = float(frame_scores.mean())
+        return average_score, len(failed_batches)
+    except Exception as e:
+        print(f"Error during video analysis: {e}")
+        traceback.print_exc()
+        raise ValueError(f"Video processing failed: {e}")
+    finally:
+        if video_path and os.path.exists(video_path):
+            try: os.unlink(video_path); print(f"Temporary file deleted: {video_path}")
+            except Exception as del_e: print(f"Error deleting temp file {video_path}: {del_e}")
+        elif temp_file and os.path.exists(temp_file.name):
+             try: os.unlink(temp_file.name); print(f"Temporary file deleted: {temp_file.name}")
+             except Exception as del_e: print(f"Error cleaning temp file object {temp_file.name}: {del_e}")
+
+## least recently used entry first
+RESULT_CACHE = collections.OrderedDict()
+result_cache_lock = threading.Lock()
+
+def hash_upload(stream):
+    """Returns the BLAKE2b digest of an uploaded file stream, read in chunks and rewound afterwards."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.digest()
+
+def get_cached_result(cache_key):
+    """Returns the cached (model_used, score) for an upload hash, or None."""
+    with result_cache_lock:
+        result = RESULT_CACHE.get(cache_key)
+        if result is not None:
+            RESULT_CACHE.move_to_end(cache_key)
+        return result
+
+def store_cached_result(cache_key, model_used, score):
+    """Caches the raw score of an upload, evicting the least recently used entry when full."""
+    with result_cache_lock:
+        RESULT_CACHE[cache_key] = (model_used, score)
+        RESULT_CACHE.move_to_end(cache_key)
+        if len(RESULT_CACHE) > RESULT_CACHE_SIZE:
+            RESULT_CACHE.popitem(last=False)
+
+def get_prediction_threshold():
+    """Returns the threshold of the node (port) the current request arrived on."""
+    try:
+        return NODE_THRESHOLDS.get(int(request.environ.get('SERVER_PORT', 0)), PREDICTION_THRESHOLD)
+    except ValueError:
+        return PREDICTION_THRESHOLD
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    API endpoint for image/video deepfake prediction.
+    Expects file in request under key 'file'.
+    Returns {"is_deepfake": bool, "confidence": float (0.0-1.0), "score": float (raw model score)}.
+    """
+    if image_model is None and video_model is None:
+         combined_errors = ". ".join(model_load_error) if model_load_error else "Models not loaded."
+         return jsonify({"error": f"No models available for prediction. Load errors: {combined_errors}"}), 500
+    if 'file' not in request.files:
+        return jsonify({"error": "No file found in request (expected key 'file')"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    try:
+        mime_type = file.mimetype
+        print(f"Received file: {file.filename}, MIME type: {mime_type}")
+        final_score = None
+        model_used = None
+        ## scores from partially analyzed videos are returned but never cached
+        cacheable = True
+        ## the raw score is cached, so every node still applies its own threshold
+        cache_key = hash_upload(file.stream)
+        cached_result = get_cached_result(cache_key)
+        if cached_result is not None:
+            model_used, final_score = cached_result
+            print(f"Reusing cached {model_used} result for identical upload.")
+        elif mime_type and mime_type.startswith('image/'):
+            if image_model is None: return jsonify({"error": f"Image model unavailable. Errors: {model_load_error}"}), 500
+            print("Processing as Image...")
+            final_score = score_image(file.read())
+            model_used = "image"
+        elif mime_type and mime_type.startswith('video/'):
+            if video_model is None: return jsonify({"error": f"Video model unavailable. Errors: {model_load_error}"}), 500
+            print("Processing as Video...")
+            final_score, failed_batches = analyze_video(file.stream)
+            cacheable = failed_batches == 0
+            model_used = "video"
+        else:
+             guessed_type, _ = mimetypes.guess_type(file.filename)
+             print(f"MIME type '{mime_type}' unclear or missing, guessed type: {guessed_type}")
+             if guessed_type and guessed_type.startswith('image/'):
+                 if image_model is None: return jsonify({"error": f"Image model unavailable (guessed). Errors: {model_load_error}"}), 500
+                 print("Processing as Image (guessed)...")
+                 final_score = score_image(file.read())
+                 model_used = "image"
+             elif guessed_type and guessed_type.startswith('video/'):
+                 if video_model is None: return jsonify({"error": f"Video model unavailable (guessed). Errors: {model_load_error}"}), 500
+                 print("Processing as Video (guessed)...")
+                 final_score, failed_batches = analyze_video(file.stream)
+                 cacheable = failed_batches == 0
+                 model_used = "video"
+             else:
+                return jsonify({"error": f"Unsupported file type: '{mime_type or guessed_type or 'Unknown'}'."}), 400
+        final_score_py = float(final_score)
+        if cached_result is None and cacheable:
+            store_cached_result(cache_key, model_used, final_score_py)
+
+        # Determine if deepfake based on this node's threshold
+        threshold = get_prediction_threshold()
+        is_deepfake_np = final_score_py >= threshold
+        is_deepfake_py = bool(is_deepfake_np)
+
+        # If predicted deepfake (score >= threshold), confidence is the score itself.
+        # If predicted real (score < threshold), confidence is (1 - score).
+        confidence_float = final_score_py if is_deepfake_py else (1.0 - final_score_py)
+        print(f"Processing complete. Model: {model_used}, Score: {final_score_py:.4f}, Threshold: {threshold}, IsDeepfake: {is_deepfake_py}, Confidence: {confidence_float:.4f}")
+        return jsonify({
+            "is_deepfake": is_deepfake_py,  
+            "confidence": confidence_float,
+            "score": final_score_py
+        })
+    except ValueError as ve:
+         print(f"Processing Error: {ve}")
+         return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        print(f"Unhandled Prediction Error: {e}")
+        traceback.print_exc()
+        return jsonify({"error": "An unexpected error occurred during processing."}), 500
+    
+def warm_up_models():
+    """Runs dummy inputs through every inference path, so the first request does not pay for
+    cuDNN algorithm selection, tracing/XLA compilation or Numba compilation."""
+    print("--- Warming Up Models ---")
+    try:
+        fused_bgr_to_rgb_norm(np.zeros((IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.uint8),
+                              np.empty((IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.float32))
+    except Exception as e:
+        print(f"Warning: Preprocessing warm-up failed: {e}")
+    if image_model is not None:
+        try:
+            run_image_model(np.zeros((1, IMAGE_HEIGHT, IMAGE_WIDTH, IMAGE_EXPECTED_CHANNELS), dtype=np.float32))
+            print("Image model warmed up.")
+        except Exception as e:
+            print(f"Warning: Image model warm-up failed: {e}")
+    if video_model is not None:
+        ## single frames and full frame batches take different kernels
+        for batch_size in (1, VIDEO_BATCH_SIZE):
+            try:
+                run_video_model(np.zeros((batch_size, VIDEO_FRAME_HEIGHT, VIDEO_FRAME_WIDTH, VIDEO_EXPECTED_CHANNELS), dtype=np.float32))
+                print(f"Video model warmed up (batch size {batch_size}).")
+            except Exception as e:
+                print(f"Warning: Video model warm-up failed (batch size {batch_size}): {e}")
+    print("----------------------------")
+
+warm_up_models()
+
+## run the app now (development server, see README for running under gunicorn)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run Deepfake Detection Flask Server Node(s).')
+    parser.add_argument('--port', type=int, nargs='+', default=[5001], help='Port(s) to run the server node(s) on')
+    parser.add_argument('--threshold', type=float, nargs='+', default=None,
+                        help='Prediction threshold, either one for all ports or one per port')
+    args = parser.parse_args()
+    thresholds = args.threshold or [PREDICTION_THRESHOLD]
+    if len(thresholds) == 1:
+        thresholds = thresholds * len(args.port)
+    if len(thresholds) != len(args.port):
+        parser.error("--threshold needs a single value or one value per --port")
+    NODE_THRESHOLDS.update(zip(args.port, thresholds))
+    if len(args.port) == 1:
+        print(f"Flask app starting on host 0.0.0.0, port {args.port[0]} (threshold {thresholds[0]})...")
+        app.run(host='0.0.0.0', port=args.port[0], debug=False, threaded=True)
+    else:
+        ## every node shares the models loaded by this process
+        servers = [make_server('0.0.0.0', port, app, threaded=True) for port in args.port]
+        for port, threshold in zip(args.port, thresholds):
+            print(f"Flask app starting on host 0.0.0.0, port {port} (threshold {threshold})...")
+        for server in servers[1:]:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[0].serve_forever()
\ No newline at end of file